@@ -0,0 +1,94 @@
+# cython: language_level=3
+"""
+Compiled versions of the simplify/derivative work-stack drivers.
+
+The expression classes, rule tables and per-operator handlers stay pure
+Python in the main module -- this only compiles the hot traversal loops,
+which are pure interpreter overhead. Build with
+
+    python setup.py build_ext --inplace
+
+and the main module will pick these up automatically.
+"""
+import sys
+
+
+cdef inline object _module_of(object expr):
+    # resolve tables off the expression's own module so this works
+    # whether that module was imported as `main` or run as `__main__`
+    return sys.modules[type(expr).__module__]
+
+
+cpdef object simplify_impl(object expr):
+    mod = _module_of(expr)
+    atomic = mod._ATOMIC
+    table = mod._SIMPLIFY
+    cdef dict memo = {}
+    cdef list stack = [(expr, False)]
+    cdef bint ready
+
+    while stack:
+        node, ready = stack.pop()
+        if node in memo:
+            continue
+
+        if getattr(node, '_simplified', False):
+            memo[node] = node
+            continue
+
+        cls = type(node)
+        if cls in atomic:
+            node._simplified = True
+            memo[node] = node
+            continue
+
+        combine = table.get(cls)
+        if combine is None:
+            raise ValueError(f'{cls} is not handled')
+
+        if not ready:
+            stack.append((node, True))
+            for child in node.args:
+                stack.append((child, False))
+        else:
+            res = combine(*[memo[child] for child in node.args])
+            res._simplified = True
+            memo[node] = res
+
+    return memo[expr]
+
+
+cpdef object derivative_impl(object expr, object var):
+    expr = simplify_impl(expr)
+    mod = _module_of(expr)
+    leaf_table = mod._DERIV_LEAF
+    table = mod._DERIV
+    cdef dict memo = {}
+    cdef list stack = [(expr, False)]
+    cdef bint ready
+
+    while stack:
+        node, ready = stack.pop()
+        if node in memo:
+            continue
+
+        cls = type(node)
+        leaf = leaf_table.get(cls)
+        if leaf is not None:
+            memo[node] = leaf(node, var)
+            continue
+
+        combine = table.get(cls)
+        if combine is None:
+            raise ValueError(f'not expecting {cls}')
+
+        if not ready:
+            stack.append((node, True))
+            for child in node.args:
+                stack.append((child, False))
+        else:
+            # list comprehension, not a genexp: Cython can't compile
+            # closures inside cpdef functions
+            memo[node] = combine(node, tuple([memo[child] for child in node.args]))
+
+    return memo[expr]
@@ -1,9 +1,19 @@
-from functools import wraps
+import math
+from weakref import WeakValueDictionary
+
+# Intern table: structurally identical expressions are the *same* object,
+# so trees collapse into DAGs and equality is a pointer compare. Values
+# are weak so unused expressions can still be collected.
+_INTERN = WeakValueDictionary()
+
 
 class Expr():
     """
     Base class for expressions
     """
+    # no per-instance __dict__: nodes are immutable once interned, so the
+    # only state is the caches + the weakref slot the intern table needs
+    __slots__ = ('_repr', '_hash', '_initialized', '_simplified', '__weakref__')
 
     def __mul__(self, other):
         return Mul(self, other)
@@ -21,106 +31,251 @@ class Expr():
         return self + -other
 
     def __neg__(self):
-        return -1 * self
+        # fold the sign into an existing Integer coefficient rather than
+        # stacking a Mul(-1, ...) on top (Integer overrides this to
+        # negate its value directly)
+        if type(self) is Mul and type(self.args[0]) is Integer:
+            return Mul(Integer(-self.args[0].value), *self.args[1:])
+
+        return Mul(_MINUS_ONE, self)
 
     def __pow__(self, n):
         return Pow(self, n)
 
+    def lambdify_numba(self, var):
+        """Compile self into a jitted numeric function of var
+
+        Evaluating the same expression on many inputs through the tree
+        costs a Python dispatch per node per call; this flattens the DAG
+        once and evaluates it in machine code (requires numba).
+        """
+        ops, left, right, consts = compile_dag(self, var)
+        eval_dag = _get_eval_dag()
+        return lambda val: eval_dag(ops, left, right, consts, val)
+
     def __eq__(self, other):
-        # easy cases
+        # interning means structurally equal exprs are the same object
         if self is other:
             return True
 
-        # FIXME: Extremely slow and stupid, use hashes or something
-        return repr(to_expr(self)) == repr(to_expr(other))
+        t = type(self)
+        if not isinstance(other, Expr):
+            # compare against a raw int without allocating an Integer
+            if t is Integer and isinstance(other, int):
+                return self.value == other
+            return self is to_expr(other)
+
+        # structural safety net for nodes that bypassed the interning
+        # factories; short-circuits on type, never builds a string
+        if t is not type(other):
+            return False
+        if t is Integer:
+            return self.value == other.value
+        if t is Symbol:
+            return self.name == other.name
+        return self.args == other.args
 
     def __ne__(self, other):
         return not (self == other)
 
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return self._repr
+
     def __str__(self):
         return repr(self)
 
+    def __getitem__(self, attr):
+        return self.args[attr]
+
 
 class BinaryOp(Expr):
+    def __new__(cls, lhs, rhs):
+        # keep the coerced children in locals while we look up the key so
+        # their ids can't be recycled mid-lookup
+        lhs, rhs = to_expr(lhs), to_expr(rhs)
+        key = (cls, id(lhs), id(rhs))
+        self = _INTERN.get(key)
+        if self is None:
+            self = _INTERN.setdefault(key, super().__new__(cls))
+        return self
+
+    __slots__ = ('lhs', 'rhs')
+
     def __init__(self, lhs, rhs):
-        self.args = [to_expr(lhs), to_expr(rhs)]
+        if getattr(self, '_initialized', False):
+            return
+        self._initialized = True
+        self.lhs = to_expr(lhs)
+        self.rhs = to_expr(rhs)
+        self._repr = self._make_repr()
+        self._hash = hash((type(self), self.lhs._hash, self.rhs._hash))
+
+    def _make_repr(self):
+        return f'({self.lhs._repr} {self.op} {self.rhs._repr})'
+
+    def __reduce__(self):
+        # pickle can't call __new__ without args; rebuild through the
+        # factory so unpickled nodes come back interned
+        return (type(self), (self.lhs, self.rhs))
 
     @property
     def op(_):
         raise NotImplementedError
 
-    def __getitem__(self, attr):
-        return self.args[attr]
+    @property
+    def args(self):
+        return (self.lhs, self.rhs)
 
-class AssocOp(BinaryOp):
+
+class AssocOp(Expr):
     """Associative property for op *
     (a * b) * c = a * (b * c) = a * b * c
+
+    Stored flat: nested applications of the same op merge into one n-ary
+    args tuple, so a + b + c is a single node and simplify sees all the
+    terms at once.
     """
-    pass
+    __slots__ = ('args',)
+
+    def __new__(cls, *args):
+        args = cls._flatten(args)
+
+        # constant folding across every operand at once (this also
+        # handles the empty and all-constant cases)
+        if all(type(a) is Integer for a in args):
+            return Integer(cls._fold(a.value for a in args))
+        if len(args) == 1:
+            return args[0]
+
+        key = (cls,) + tuple(map(id, args))
+        self = _INTERN.get(key)
+        if self is None:
+            self = _INTERN.setdefault(key, super().__new__(cls))
+        return self
+
+    def __init__(self, *args):
+        if getattr(self, '_initialized', False):
+            return
+        self._initialized = True
+        self.args = args = self._flatten(args)
+        self._repr = '(' + f' {self.op} '.join(a._repr for a in args) + ')'
+        self._hash = hash((type(self),) + tuple(a._hash for a in args))
+
+    @classmethod
+    def _flatten(cls, args):
+        # splice children of the same op: Add(Add(a, b), c) -> (a, b, c)
+        args = (t for a in map(to_expr, args)
+                for t in (a.args if type(a) is cls else (a,)))
+        # canonical (commutative) operand order, so x+y and y+x intern
+        # to the same node and every downstream memo/CSE hit fires
+        return tuple(sorted(args, key=_canon_key))
+
+    def __reduce__(self):
+        # rebuild through the factory so unpickled nodes come back interned
+        return (type(self), tuple(self.args))
+
+    @property
+    def op(_):
+        raise NotImplementedError
 
 
-class DistOp(BinaryOp):
+class DistOp(Expr):
     """Distribute w/r to addition (for op *)
     a * (b + c) = a * b + b * c
     """
-    pass
+    __slots__ = ()
 
 
 class Pow(BinaryOp):
+    __slots__ = ()
+
     @property
     def op(_):
         return '**'
 
-    def __repr__(self):
-        return f'({self[0]}**{self[1]})'
+    def _make_repr(self):
+        # no spaces around ** to match convention
+        return f'({self.lhs._repr}**{self.rhs._repr})'
 
 class Mul(AssocOp, DistOp):
+    __slots__ = ()
+    _fold = staticmethod(math.prod)
+
     @property
     def op(_):
         return '*'
 
-    def __repr__(self):
-        return f'({self[0]} * {self[1]})'
-
 
 class Add(AssocOp, DistOp):
+    __slots__ = ()
+    _fold = staticmethod(sum)
+
     @property
     def op(_):
         return '+'
 
-    def __repr__(self):
-        return f'({self[0]} + {self[1]})'
-
 
 class AtomicExpr(Expr):
     """
     An Atom is an expression with no subexpressions
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class Symbol(AtomicExpr):
+    __slots__ = ('name',)
+
+    def __new__(cls, name: str):
+        key = ('S', name)
+        self = _INTERN.get(key)
+        if self is None:
+            self = _INTERN.setdefault(key, super().__new__(cls))
+        return self
+
     def __init__(self, name: str):
+        if getattr(self, '_initialized', False):
+            return
+        self._initialized = True
         super().__init__()
         assert isinstance(name, str), f'name of Symbol must be str, got {type(name)}'
         self.name = name
+        self._repr = name
+        self._hash = hash((str, name))
 
-    def __repr__(self):
-        return self.name
-
-    def __eq__(self, other):
-        return isinstance(other, Symbol) and self.name == other.name
+    def __reduce__(self):
+        # rebuild through the factory so unpickled nodes come back interned
+        return (type(self), (self.name,))
 
 
 class Integer(AtomicExpr):
+    __slots__ = ('value',)
+
+    def __new__(cls, value: int):
+        key = ('I', value)
+        self = _INTERN.get(key)
+        if self is None:
+            self = _INTERN.setdefault(key, super().__new__(cls))
+        return self
+
     def __init__(self, value: int):
+        if getattr(self, '_initialized', False):
+            return
+        self._initialized = True
         super().__init__()
         assert isinstance(value, int), f'type(value) {type(value)} != int'
         self.value = value
+        self._repr = str(value)
+        self._hash = hash((int, value))
 
-    def __repr__(self):
-        return str(self.value)
+    def __reduce__(self):
+        # rebuild through the factory so unpickled nodes come back interned
+        return (type(self), (self.value,))
 
     def __add__(self, other):
         other = to_expr(other)
@@ -130,6 +285,36 @@ class Integer(AtomicExpr):
 
         return Add(self, other)
 
+    def __mul__(self, other):
+        other = to_expr(other)
+        if isinstance(other, Integer):
+            return Integer(self.value * other.value)
+
+        return Mul(self, other)
+
+    def __rmul__(self, other):
+        return self * other
+
+    def __neg__(self):
+        return Integer(-self.value)
+
+
+# sort key for commutative operands: constants first, then by node kind,
+# ties broken by the cached repr (deterministic across runs, unlike the
+# randomized string hashes)
+_RANK = {Integer: 0, Symbol: 1, Pow: 2, Mul: 3, Add: 4}
+
+
+def _canon_key(e):
+    return (_RANK.get(type(e), len(_RANK)), e._repr)
+
+
+# interned sentinels: simplify/derivative check against these with `is`,
+# no allocation and no __eq__ call
+_ZERO = Integer(0)
+_ONE = Integer(1)
+_MINUS_ONE = Integer(-1)
+
 
 def to_expr(thing):
     """Convert a python type to an algebruh type if possible
@@ -144,19 +329,124 @@ def to_expr(thing):
         return thing
 
     if isinstance(thing, int):
+        # 0 and 1 are by far the most converted constants
+        if thing == 0: return _ZERO
+        if thing == 1: return _ONE
         return Integer(thing)
 
     raise ValueError(f'Cannot convert {thing} to Expr')
 
 
-def to_expr_ret(fn):
-    @wraps(fn)
-    def _fn(*args, **kwargs):
-        return to_expr(fn(*args, **kwargs))
-    return _fn
+# combine handlers get a node's already-simplified children and rebuild
+# the minimal equivalent. With n-ary Add/Mul this is one aggregation
+# pass over all operands instead of pairwise rewrite rules, so
+# 0 + x + 0 + x collapses in a single visit.
+
+def _simp_add(*args):
+    # sum the constants, bucket every other term by its base with an
+    # integer coefficient: x + 2*x -> 3*x, 0s drop out
+    args = Add._flatten(args)
+    const = 0
+    coeffs = {}  # base -> int coefficient, in first-seen order
+    for term in args:
+        if type(term) is Integer:
+            const += term.value
+            continue
+        if type(term) is Mul and type(term.args[0]) is Integer:
+            coeff = term.args[0].value
+            rest = term.args[1:]
+            base = rest[0] if len(rest) == 1 else Mul(*rest)
+        else:
+            coeff, base = 1, term
+        coeffs[base] = coeffs.get(base, 0) + coeff
+
+    parts = []
+    for base, coeff in coeffs.items():
+        if coeff == 0:
+            continue
+        parts.append(base if coeff == 1 else Integer(coeff)*base)
+    if const != 0 or not parts:
+        parts.append(Integer(const))
+    return parts[0] if len(parts) == 1 else Add(*parts)
+
+
+def _simp_mul(*args):
+    # fold the constants, collect repeated bases into powers
+    # (x * x**2 -> x**3), 1s drop out and zero annihilates
+    args = Mul._flatten(args)
+    const = 1
+    powers = {}  # base -> list of exponents, in first-seen order
+    for factor in args:
+        if type(factor) is Integer:
+            const *= factor.value
+            continue
+        if type(factor) is Pow:
+            base, exp = factor.lhs, factor.rhs
+        else:
+            base, exp = factor, _ONE
+        powers.setdefault(base, []).append(exp)
+
+    if const == 0:
+        return _ZERO
+
+    parts = []
+    for base, exps in powers.items():
+        exp = exps[0] if len(exps) == 1 else _simp_add(*exps)
+        parts.append(_simp_pow(base, exp))
+    if const != 1 or not parts:
+        parts.insert(0, Integer(const))
+    return parts[0] if len(parts) == 1 else Mul(*parts)
+
+
+def _simp_pow(a, b):
+    if b is _ONE:  # x**1 -> x
+        return a
+
+    return a**b
+
+
+_ATOMIC = frozenset((Integer, Symbol))
+_SIMPLIFY = {Add: _simp_add, Mul: _simp_mul, Pow: _simp_pow}
+
+
+def _simplify_impl(expr: Expr):
+    # iterative post-order walk: no recursion-depth limit, no per-node
+    # frame overhead, and the memo means shared (interned) subtrees are
+    # only simplified once
+    memo = {}  # node -> simplified node; hashing hits the cached _hash
+    stack = [(expr, False)]
+    while stack:
+        node, ready = stack.pop()
+        if node in memo:
+            continue
+
+        # nodes a previous simplify call produced are already canonical
+        if getattr(node, '_simplified', False):
+            memo[node] = node
+            continue
+
+        cls = type(node)
+        if cls in _ATOMIC:
+            node._simplified = True
+            memo[node] = node
+            continue
+
+        combine = _SIMPLIFY.get(cls)
+        if combine is None:
+            raise ValueError(f'{cls} is not handled')
+
+        if not ready:
+            stack.append((node, True))
+            for child in node.args:
+                stack.append((child, False))
+        else:
+            res = combine(*[memo[child] for child in node.args])
+            res._simplified = True
+            memo[node] = res
+
+    return memo[expr]
 
 
-@to_expr_ret
 def simplify(expr: Expr):
     """
     Simplify an expression
@@ -173,51 +463,128 @@ def simplify(expr: Expr):
     >>> simplify(x**2 * x**3)
     (x**5)
     >>> simplify(x**2 + 2*x**2)
-    (3 * x**2)
+    (3 * (x**2))
+    """
+    # thin boundary wrapper: coerce once here, internal callers hit
+    # _simplify_impl directly
+    return _simplify_impl(to_expr(expr))
+
+
+# leaf handlers return the derivative directly, combine handlers get the
+# children's already-computed derivatives
+
+def _deriv_integer(node, var):
+    return _ZERO
+
+
+def _deriv_symbol(node, var):
+    return _ONE if node is var else _ZERO
+
+
+def _deriv_pow(node, var):
+    a = node.lhs # a**n
+    n = node.rhs
+    return _simplify_impl(n * a**(n-1))
+
+
+def _deriv_add(node, dargs):
+    return _simp_add(*dargs)
+
+
+def _deriv_mul(node, dargs):
+    # fused n-ary product rule: sum_i d_i * (other factors), skipping
+    # terms whose factor derivative is zero -- common since constants
+    # differentiate to zero
+    args = node.args
+    terms = []
+    for i, d in enumerate(dargs):
+        if d is _ZERO:
+            continue
+        terms.append(_simp_mul(d, *args[:i], *args[i+1:]))
+
+    if not terms:
+        return _ZERO
+    return terms[0] if len(terms) == 1 else _simp_add(*terms)
+
+
+_DERIV_LEAF = {Integer: _deriv_integer, Symbol: _deriv_symbol, Pow: _deriv_pow}
+_DERIV = {Add: _deriv_add, Mul: _deriv_mul}
+
+
+def _derivative_impl(expr: Expr, var: Symbol):
+    # same explicit-stack walk as simplify; the memo means the derivative
+    # of a shared subtree (e.g. both sides of the product rule) is reused
+    expr = _simplify_impl(expr)
+    memo = {}
+    stack = [(expr, False)]
+    while stack:
+        node, ready = stack.pop()
+        if node in memo:
+            continue
+
+        cls = type(node)
+        leaf = _DERIV_LEAF.get(cls)
+        if leaf is not None:
+            memo[node] = leaf(node, var)
+            continue
+
+        combine = _DERIV.get(cls)
+        if combine is None:
+            raise ValueError(f'not expecting {cls}')
+
+        if not ready:
+            stack.append((node, True))
+            for child in node.args:
+                stack.append((child, False))
+        else:
+            memo[node] = combine(
+                node,
+                tuple(memo[child] for child in node.args),
+            )
+
+    return memo[expr]
+
+
+def cse(expr):
+    """Rebuild expr so every structurally identical subtree is one
+    shared node (a DAG instead of a tree)
+
+    Expressions built through the normal operators are already interned
+    and come out of this unchanged; it exists for trees that bypassed
+    the factories, e.g. unpickled or hand-constructed nodes.
+    >>> cse(x*x + x*x) is (x*x + x*x)
+    True
     """
     expr = to_expr(expr)
-    if isinstance(expr, AtomicExpr):
-        return expr
-    elif isinstance(expr, Add):
-        a = simplify(expr[0])
-        b = simplify(expr[1])
-        if a == 0: return b
-        if b == 0: return a
-        if a == b: return 2*a
-
-        return a + b
-    elif isinstance(expr, Mul):
-        a = simplify(expr[0])
-        b = simplify(expr[1])
-        if a == 0 or b == 0: return to_expr(0)
-        if a == 1: return b
-        if b == 1: return a
-        if a == b:
-            return a**2
-
-        if isinstance(a, Pow) and isinstance(b, Pow) and a[0] == b[0]:
-            return Pow(a[0], a[1]+b[1])
-
-        return a*b
-    elif isinstance(expr, Pow):
-        a = simplify(expr[0])
-        b = simplify(expr[1])
-        if b == 1:
-            return a
-
-        return a**b
-    else:
-        raise ValueError(f'{type(expr)} is not handled')
-
-
-def simplify_ret(fn):
-    @wraps(fn)
-    def _fn(*args, **kwargs):
-        return simplify(fn(*args, **kwargs))
-    return _fn
-
-
-@simplify_ret
+    # keyed by id, not by node: foreign nodes may predate the cached
+    # _hash and the whole input is kept alive by `expr` anyway
+    memo = {}
+    stack = [(expr, False)]
+    while stack:
+        node, ready = stack.pop()
+        if id(node) in memo:
+            continue
+
+        cls = type(node)
+        if cls is Integer:
+            memo[id(node)] = Integer(node.value)
+        elif cls is Symbol:
+            memo[id(node)] = Symbol(node.name)
+        elif cls in _SIMPLIFY:
+            if not ready:
+                stack.append((node, True))
+                for child in node.args:
+                    stack.append((child, False))
+            else:
+                # constructing through __new__ hits the intern table, so
+                # duplicate subtrees collapse onto the same object
+                memo[id(node)] = cls(*(memo[id(c)] for c in node.args))
+        else:
+            raise ValueError(f'{cls} is not handled')
+
+    return memo[id(expr)]
+
+
 def derivative(expr: Expr, var: Symbol):
     """
     Take the derivative of expr with respect to var
@@ -226,43 +593,228 @@ def derivative(expr: Expr, var: Symbol):
     >>> derivative(x*x, x)
     (2 * x)
     >>> derivative(x**2 + 3*x**3 + 5, x)
-    ((2 * x) + (9 * x**3))
+    ((2 * x) + (9 * (x**2)))
     """
-    expr = simplify(to_expr(expr))
-
-    if isinstance(expr, Add):
-        return derivative(expr[0], var) + derivative(expr[1], var)
-    elif isinstance(expr, Mul):
-        # product rule
-        return (
-            derivative(expr[0], var)*expr[1]
-            + derivative(expr[1], var)*expr[0]
-        )
-    elif isinstance(expr, Pow):
-        a = expr[0] # a**n
-        n = expr[1]
-        return n * a**(n-1)
-    elif isinstance(expr, Integer):
-        return 0
-    elif isinstance(expr, Symbol):
-        return 1 if expr == var else 0
-    else:
-        raise ValueError(f'not expecting {type(expr)}')
+    return _derivative_impl(to_expr(expr), var)
+
+
+# handlers append tokens to buf and push children (and literal tokens)
+# on the work stack; to_sexpr joins the buffer once at the end
+
+def _sexpr_binop(expr, buf, stack):
+    buf.append(f'({expr.op} ')
+    stack.append(')')
+    args = expr.args
+    for i in range(len(args) - 1, 0, -1):
+        stack.append(args[i])
+        stack.append(' ')
+    stack.append(args[0])
+
+
+def _sexpr_atom(expr, buf, stack):
+    buf.append(expr._repr)
+
+
+_SEXPR = {
+    Add: _sexpr_binop, Mul: _sexpr_binop, Pow: _sexpr_binop,
+    Integer: _sexpr_atom, Symbol: _sexpr_atom,
+}
 
 
 def to_sexpr(expr):
     """Convert expr to an s-expression
-    >>> to_sexpr(Integer(2) + Integer(3) * Integer(4))
-    '(+ 2 (* 3 4))'
+    >>> to_sexpr(x + Integer(3) * x)
+    '(+ x (* 3 x))'
     """
+    buf = []
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if type(node) is str:  # literal token pushed by a handler
+            buf.append(node)
+            continue
+
+        handler = _SEXPR.get(type(node))
+        if handler is None:
+            raise ValueError(f'unsupported type {type(node)}')
 
-    if isinstance(expr, BinaryOp):
-        return f'({expr.op} {" ".join(map(to_sexpr, expr.args))})'
-    elif isinstance(expr, AtomicExpr):
-        return str(expr)
-    else:
-        raise ValueError(f'unsupported type {type(expr)}')
+        handler(node, buf, stack)
 
+    return ''.join(buf)
+
+
+
+_CODEGEN_CACHE = {}  # (expr, var) -> compiled function
+
+
+def codegen_derivative(expr, var):
+    """Bake the derivative of expr w/r to var into a plain function
+
+    Takes the symbolic derivative once, flattens it into straight-line
+    code (one temp per unique subtree, so shared subtrees are computed
+    once) and compiles that with exec. Calling the result evaluates the
+    derivative numerically with no symbolic machinery at all.
+    >>> f = codegen_derivative(x*x + 3*x, x)
+    >>> f(2)
+    7
+    """
+    expr = to_expr(expr)
+    key = (expr, var)
+    fn = _CODEGEN_CACHE.get(key)
+    if fn is not None:
+        return fn
+
+    d = _derivative_impl(expr, var)
+    lines = []
+    names = {}  # node -> temp name (or literal for atoms)
+    stack = [(d, False)]
+    while stack:
+        node, ready = stack.pop()
+        if node in names:
+            continue
+
+        cls = type(node)
+        if cls is Integer:
+            # parenthesize negatives: a bare -2 ** t would parse as
+            # -(2 ** t) since unary minus binds looser than **
+            v = node.value
+            names[node] = repr(v) if v >= 0 else f'({v})'
+        elif cls is Symbol:
+            if node is not var:
+                raise ValueError(f'cannot compile free symbol {node.name}')
+            names[node] = var.name
+        elif cls in _SIMPLIFY:
+            if not ready:
+                stack.append((node, True))
+                for child in node.args:
+                    stack.append((child, False))
+            else:
+                name = f't{len(lines)}'
+                operands = f' {node.op} '.join(names[c] for c in node.args)
+                lines.append(f'{name} = {operands}')
+                names[node] = name
+        else:
+            raise ValueError(f'{cls} is not handled')
+
+    body = ''.join(f'    {line}\n' for line in lines)
+    src = f'def _deriv({var.name}):\n{body}    return {names[d]}\n'
+    namespace = {}
+    exec(src, namespace)
+    fn = namespace['_deriv']
+    _CODEGEN_CACHE[key] = fn
+    return fn
+
+
+# --- flattened-array evaluation (optional, needs numpy + numba) ---
+#
+# the DAG is serialized structure-of-arrays style: one slot per unique
+# subtree with an op code, child indices and a constant value, evaluated
+# bottom-up by a jitted loop. op codes:
+_OP_CONST, _OP_VAR, _OP_ADD, _OP_MUL, _OP_POW = 0, 1, 2, 3, 4
+
+_BINOP_CODES = {Add: _OP_ADD, Mul: _OP_MUL, Pow: _OP_POW}
+
+
+def compile_dag(expr, var):
+    """Flatten expr into (op_codes, left, right, consts) numpy arrays
+
+    Each unique (interned) subtree gets exactly one slot; the root is the
+    last slot. Evaluate with the jitted loop from _get_eval_dag.
+    """
+    import numpy as np
+
+    expr = to_expr(expr)
+    index = {}  # node -> slot; shared subtrees are emitted once
+    ops, left, right, consts = [], [], [], []
+    stack = [(expr, False)]
+    while stack:
+        node, ready = stack.pop()
+        if node in index:
+            continue
+
+        cls = type(node)
+        if cls is Integer:
+            index[node] = len(ops)
+            ops.append(_OP_CONST)
+            left.append(-1)
+            right.append(-1)
+            consts.append(float(node.value))
+        elif cls is Symbol:
+            if node is not var:
+                raise ValueError(f'cannot compile free symbol {node.name}')
+            index[node] = len(ops)
+            ops.append(_OP_VAR)
+            left.append(-1)
+            right.append(-1)
+            consts.append(0.0)
+        elif cls in _BINOP_CODES:
+            if not ready:
+                stack.append((node, True))
+                for child in node.args:
+                    stack.append((child, False))
+            else:
+                # n-ary nodes decompose into a chain of binary slots
+                code = _BINOP_CODES[cls]
+                children = node.args
+                idx = index[children[0]]
+                for child in children[1:]:
+                    ops.append(code)
+                    left.append(idx)
+                    right.append(index[child])
+                    consts.append(0.0)
+                    idx = len(ops) - 1
+                index[node] = idx
+        else:
+            raise ValueError(f'{cls} is not handled')
+
+    return (
+        np.asarray(ops, dtype=np.int64),
+        np.asarray(left, dtype=np.int64),
+        np.asarray(right, dtype=np.int64),
+        np.asarray(consts, dtype=np.float64),
+    )
+
+
+_eval_dag = None
+
+
+def _get_eval_dag():
+    # jit once, lazily, so importing this module never requires numba
+    global _eval_dag
+    if _eval_dag is None:
+        import numpy as np
+        from numba import njit
+
+        @njit(cache=True)
+        def eval_dag(ops, left, right, consts, var_val):
+            out = np.empty(len(ops))
+            for i in range(len(ops)):
+                op = ops[i]
+                if op == 0:
+                    out[i] = consts[i]
+                elif op == 1:
+                    out[i] = var_val
+                elif op == 2:
+                    out[i] = out[left[i]] + out[right[i]]
+                elif op == 3:
+                    out[i] = out[left[i]] * out[right[i]]
+                else:
+                    out[i] = out[left[i]] ** out[right[i]]
+            return out[len(ops) - 1]
+
+        _eval_dag = eval_dag
+    return _eval_dag
+
+
+# optional compiled traversal loops (see setup.py); the pure-Python
+# implementations above stay the reference
+try:
+    import algebruh_c
+except ImportError:
+    pass
+else:
+    _simplify_impl = algebruh_c.simplify_impl
+    _derivative_impl = algebruh_c.derivative_impl
 
 
 if __name__ == '__main__':
@@ -0,0 +1,8 @@
+"""Build the optional compiled walkers: python setup.py build_ext --inplace"""
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name='algebruh',
+    ext_modules=cythonize('algebruh_c.pyx'),
+)